@@ -0,0 +1,176 @@
+"""
+Compare sync and async agent throughput under concurrent conversations.
+
+Both runs drive a real AgentExecutor built with the app's prompt. The sync run
+mirrors the old Bolt ``App`` deployment: every conversation is a blocking
+``invoke`` call on a worker pool. The async run mirrors ``AsyncApp``: every
+conversation is an ``ainvoke`` coroutine on a single event loop. Both runs are
+limited to the same number of conversations in flight (--concurrency), so the
+difference comes from how the executor dispatches a turn, not from the pool size.
+
+By default the app's own executor is used (from main), which talks to the real
+LLM, GitHub, Linear and Postgres backends configured in credentials.env, so keep
+the conversation count modest. Each run uses its own session ids, so the async run
+does not read the history the sync run wrote.
+
+With --simulate, no backend is called. The executor gets a simulated chat model
+that asks for two tool calls and then answers, and two simulated tools. Each of
+them sleeps for the latency given on the command line: time.sleep when called
+through invoke, asyncio.sleep when called through ainvoke.
+
+Usage (from the repository root):
+    python -m benchmarks.async_throughput --conversations 50
+    python -m benchmarks.async_throughput --conversations 50 --simulate
+"""
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional
+
+from langchain.agents import AgentExecutor, create_openai_tools_agent
+from langchain.tools import BaseTool
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+QUESTION = "Yes, I am ready to provide the update."
+SIMULATED_TOOLS = ["github_linear_update", "get_update_from_memory"]
+
+
+class SimulatedChatModel(BaseChatModel):
+    """Chat model that calls every tool once, then answers, after a fixed latency."""
+
+    seconds: float
+    tool_names: List[str]
+
+    @property
+    def _llm_type(self) -> str:
+        return "simulated"
+
+    def _respond(self, messages: List[BaseMessage]) -> ChatResult:
+        if messages and isinstance(messages[-1], ToolMessage):
+            message = AIMessage(content="Here is your draft update.")
+        else:
+            message = AIMessage(
+                content="",
+                tool_calls=[{"name": name, "args": {}, "id": f"call_{index}"} for index, name in enumerate(self.tool_names)],
+            )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.seconds)
+        return self._respond(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.seconds)
+        return self._respond(messages)
+
+
+class SimulatedTool(BaseTool):
+    """Tool that returns after a fixed latency."""
+
+    seconds: float
+
+    def _run(self, *args: Any, **kwargs: Any) -> str:
+        time.sleep(self.seconds)
+        return f"{self.name} result"
+
+    async def _arun(self, *args: Any, **kwargs: Any) -> str:
+        await asyncio.sleep(self.seconds)
+        return f"{self.name} result"
+
+
+def simulated_executor(llm_seconds, tool_seconds):
+    from common.prompts import CUSTOM_CHATBOT_PROMPT
+
+    tools = [SimulatedTool(name=name, description=f"Simulated {name}", seconds=tool_seconds) for name in SIMULATED_TOOLS]
+    llm = SimulatedChatModel(seconds=llm_seconds, tool_names=SIMULATED_TOOLS)
+    agent = create_openai_tools_agent(llm, tools, CUSTOM_CHATBOT_PROMPT)
+    return AgentExecutor(agent=agent, tools=tools, verbose=False)
+
+
+def conversation_config(run, index):
+    return {"configurable": {"session_id": f"bench-{run}-session-{index}", "user_id": f"bench-{run}-user-{index}"}}
+
+
+def agent_turns(simulate, llm_seconds, tool_seconds):
+    """Return (sync_turn, async_turn) callables that run one conversation turn."""
+    if simulate:
+        executor = simulated_executor(llm_seconds, tool_seconds)
+
+        def sync_turn(index):
+            executor.invoke({"question": QUESTION})
+
+        async def async_turn(index):
+            await executor.ainvoke({"question": QUESTION})
+
+        return sync_turn, async_turn
+
+    from main import brain_agent_executor
+
+    def sync_turn(index):
+        brain_agent_executor.invoke({"question": QUESTION}, config=conversation_config("sync", index))
+
+    async def async_turn(index):
+        await brain_agent_executor.ainvoke({"question": QUESTION}, config=conversation_config("async", index))
+
+    return sync_turn, async_turn
+
+
+def run_sync(turn, conversations, concurrency):
+    def one(index):
+        start = time.perf_counter()
+        turn(index)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(one, range(conversations)))
+    return time.perf_counter() - start, latencies
+
+
+async def run_async(turn, conversations, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(index):
+        async with semaphore:
+            start = time.perf_counter()
+            await turn(index)
+            return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*[one(index) for index in range(conversations)])
+    return time.perf_counter() - start, latencies
+
+
+def report(label, conversations, elapsed, latencies):
+    latencies = sorted(latencies)
+    p50 = latencies[len(latencies) // 2]
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(
+        f"{label:<6} conversations={conversations} wall={elapsed:.2f}s "
+        f"throughput={conversations / elapsed:.2f} conv/s p50={p50:.2f}s p95={p95:.2f}s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10, help="conversations in flight at once, in both runs (Bolt's default pool is 10 threads)")
+    parser.add_argument("--simulate", action="store_true", help="replace the LLM and the tools with simulated latency")
+    parser.add_argument("--llm-seconds", type=float, default=1.5, help="simulated latency of one LLM call")
+    parser.add_argument("--tool-seconds", type=float, default=0.5, help="simulated latency of one tool call")
+    args = parser.parse_args()
+
+    sync_turn, async_turn = agent_turns(args.simulate, args.llm_seconds, args.tool_seconds)
+
+    elapsed, latencies = run_sync(sync_turn, args.conversations, args.concurrency)
+    report("sync", args.conversations, elapsed, latencies)
+
+    elapsed, latencies = asyncio.run(run_async(async_turn, args.conversations, args.concurrency))
+    report("async", args.conversations, elapsed, latencies)
+
+
+if __name__ == "__main__":
+    main()
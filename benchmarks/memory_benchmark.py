@@ -0,0 +1,175 @@
+"""
+Compare peak memory of full-body and streaming ingestion of GitHub and Linear responses.
+
+Synthetic payloads of growing size are written to a temporary file, which stands
+in for the HTTP response body. The fetchers the background sync uses are then run
+against it, with requests patched to serve the file as a streamed response:
+
+- github: iter_github_events over one page of events
+- linear: iter_linear_user_activities_since over one page of issues, each with
+          many comments (parsed by iter_connection_nodes)
+
+For each payload the script runs two paths under tracemalloc:
+
+- full:      json.load the whole body, then walk the records (the old path)
+- streaming: consume the fetcher's iterator one record at a time (the sync path)
+
+tracemalloc reports Python heap allocations. That is the part of the process
+RSS that grows with payload size here. The streaming peak should stay flat
+while the full-body peak grows linearly.
+
+Usage (from the repository root):
+    python -m benchmarks.memory_benchmark --sizes 1000 5000 20000
+"""
+import argparse
+import io
+import json
+import os
+import tempfile
+import tracemalloc
+from unittest import mock
+
+from common.fetch_info import iter_github_events, iter_linear_user_activities_since
+
+COMMENTS_PER_ISSUE = 20
+
+
+def synthetic_event(index):
+    return {
+        "id": str(index),
+        "type": "IssueCommentEvent",
+        "created_at": "2025-01-13T12:00:00Z",
+        "repo": {"name": "octo/repo"},
+        "payload": {
+            "action": "created",
+            "issue": {"html_url": f"https://github.com/octo/repo/issues/{index}"},
+            "comment": {"body": "lorem ipsum dolor sit amet " * 40},
+        },
+    }
+
+
+def synthetic_issue(index):
+    return {
+        "id": f"issue-{index}",
+        "title": f"Issue {index}",
+        "updatedAt": "2025-01-13T12:00:00.000Z",
+        "createdAt": "2024-12-01T09:00:00.000Z",
+        "state": {"name": "In Progress"},
+        "comments": {
+            "nodes": [
+                {"id": f"comment-{index}-{number}", "body": "lorem ipsum dolor sit amet " * 10, "createdAt": "2025-01-13T12:00:00.000Z"}
+                for number in range(COMMENTS_PER_ISSUE)
+            ]
+        },
+    }
+
+
+def write_array(f, records):
+    f.write("[")
+    for index, record in enumerate(records):
+        if index:
+            f.write(",")
+        json.dump(record, f)
+    f.write("]")
+
+
+def write_github_payload(path, size):
+    with open(path, "w") as f:
+        write_array(f, (synthetic_event(index) for index in range(size)))
+
+
+def write_linear_payload(path, size):
+    with open(path, "w") as f:
+        f.write('{"data": {"issues": {"pageInfo": {"hasNextPage": false, "endCursor": null}, "nodes": ')
+        write_array(f, (synthetic_issue(index) for index in range(size)))
+        f.write("}}}")
+
+
+class RawBody(io.BufferedReader):
+    """File body that accepts the decode_content flag the fetchers set on response.raw."""
+
+
+class FileResponse:
+    """Streamed requests response whose body is a local file."""
+
+    status_code = 200
+    text = ""
+
+    def __init__(self, path):
+        self.raw = RawBody(io.FileIO(path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.raw.close()
+
+
+def full_github(path):
+    with open(path, "rb") as f:
+        events = json.load(f)
+    return [event["id"] for event in events][-1], len(events)
+
+
+def streaming_github(path):
+    with mock.patch("common.fetch_info.requests.get", lambda *args, **kwargs: FileResponse(path)):
+        count, last = 0, None
+        for event in iter_github_events("octocat", pages=1):
+            count, last = count + 1, event["id"]
+    return last, count
+
+
+def full_linear(path):
+    with open(path, "rb") as f:
+        issues = json.load(f)["data"]["issues"]["nodes"]
+    return [issue["id"] for issue in issues][-1], len(issues)
+
+
+def streaming_linear(path):
+    with mock.patch("common.fetch_info.requests.post", lambda *args, **kwargs: FileResponse(path)):
+        count, last = 0, None
+        for issue in iter_linear_user_activities_since("user-id", "key", "https://linear.invalid", "2025-01-01T00:00:00.000Z"):
+            count, last = count + 1, issue["id"]
+    return last, count
+
+
+SOURCES = {
+    "github": (write_github_payload, full_github, streaming_github),
+    "linear": (write_linear_payload, full_linear, streaming_linear),
+}
+
+
+def peak_memory(func, path):
+    tracemalloc.start()
+    try:
+        result = func(path)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--sources", nargs="+", choices=sorted(SOURCES), default=sorted(SOURCES))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "body.json")
+        print(f"{'source':>7} {'records':>8} {'body MB':>8} {'full MB':>8} {'stream MB':>10}")
+        for source in args.sources:
+            write_payload, full, streaming = SOURCES[source]
+            for size in args.sizes:
+                write_payload(path, size)
+                full_peak, full_result = peak_memory(full, path)
+                stream_peak, stream_result = peak_memory(streaming, path)
+                assert full_result == stream_result
+                print(
+                    f"{source:>7} {size:>8} {os.path.getsize(path) / 2**20:>8.1f} "
+                    f"{full_peak / 2**20:>8.1f} {stream_peak / 2**20:>10.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+import os
+import json
+import sqlite3
+import asyncio
+import datetime
+import threading
+from itertools import islice, takewhile
+from contextlib import contextmanager
+
+from common.fetch_info import fetch_linear_user_id, iter_linear_user_activities_since, iter_github_events
+
+####################################################################################################################################
+# LOCAL ACTIVITY STORE
+####################################################################################################################################
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS activity (
+    source TEXT NOT NULL,
+    record_id TEXT NOT NULL,
+    username TEXT NOT NULL,
+    occurred_at TEXT NOT NULL,
+    parent_id TEXT,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (source, record_id)
+);
+CREATE INDEX IF NOT EXISTS idx_activity_user_time ON activity (username, occurred_at);
+CREATE TABLE IF NOT EXISTS sync_state (
+    source TEXT NOT NULL,
+    username TEXT NOT NULL,
+    cursor TEXT,
+    synced_at TEXT,
+    PRIMARY KEY (source, username)
+);
+"""
+
+GITHUB = "github"
+LINEAR = "linear"
+# Dated markers of what happened on a Linear issue (creation, comments); parent_id is the issue id
+LINEAR_EVENT = "linear_event"
+
+# How far back the first Linear sync for a user reaches
+INITIAL_LOOKBACK_DAYS = 30
+# Records written per transaction while a sync streams in
+SYNC_BATCH_SIZE = 100
+
+class ActivityStore:
+    """
+    Embedded SQLite copy of the GitHub and Linear activity of our users.
+    Records are keyed by (source, record_id) and indexed on (username, occurred_at).
+    GitHub events are stored at their created_at. A Linear issue is stored once, at its
+    updatedAt, and gets a LINEAR_EVENT marker row for its creation and for each comment,
+    so an old issue that saw activity on a given day is found for that day.
+    A connection is opened and closed per call so the store can be used from the sync
+    thread and the request handlers at the same time.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """Yield a connection inside a transaction and close it afterwards."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def upsert(self, source, username, records, id_key, date_key, parent_key=None):
+        rows = [
+            (source, str(record[id_key]), username, record[date_key],
+             record.get(parent_key) if parent_key else None, json.dumps(record))
+            for record in records
+        ]
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO activity (source, record_id, username, occurred_at, parent_id, payload) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        return len(rows)
+
+    def get_cursor(self, source, username):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT cursor FROM sync_state WHERE source = ? AND username = ?", (source, username)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_cursor(self, source, username, cursor):
+        synced_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sync_state (source, username, cursor, synced_at) VALUES (?, ?, ?, ?)",
+                (source, username, cursor, synced_at),
+            )
+
+    def has_synced(self, username, source):
+        """Whether the given source has completed at least one sync for the user."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM sync_state WHERE source = ? AND username = ?", (source, username)
+            ).fetchone()
+        return row is not None
+
+    def activity_between(self, username, start_date, end_date):
+        """
+        Return (linear_issues, github_events) for the user with occurred_at between
+        start_date and end_date (YYYY-MM-DD, both inclusive), oldest first.
+        """
+        end_exclusive = (datetime.date.fromisoformat(end_date) + datetime.timedelta(days=1)).isoformat()
+        with self._connect() as conn:
+            github_rows = conn.execute(
+                """
+                SELECT payload FROM activity
+                WHERE source = ? AND username = ? AND occurred_at >= ? AND occurred_at < ?
+                ORDER BY occurred_at
+                """,
+                (GITHUB, username, start_date, end_exclusive),
+            ).fetchall()
+            # Issues updated in the range, or created or commented on in it
+            linear_rows = conn.execute(
+                """
+                SELECT payload FROM activity
+                WHERE source = ? AND username = ? AND (
+                    (occurred_at >= ? AND occurred_at < ?)
+                    OR record_id IN (
+                        SELECT parent_id FROM activity
+                        WHERE source = ? AND username = ? AND occurred_at >= ? AND occurred_at < ?
+                    )
+                )
+                ORDER BY occurred_at
+                """,
+                (LINEAR, username, start_date, end_exclusive, LINEAR_EVENT, username, start_date, end_exclusive),
+            ).fetchall()
+
+        linear_issues = [json.loads(payload) for (payload,) in linear_rows]
+        github_events = [json.loads(payload) for (payload,) in github_rows]
+        return linear_issues, github_events
+
+    def sync_github(self, username):
+        """Fetch GitHub events newer than the stored cursor. Events arrive newest first."""
+        cursor = self.get_cursor(GITHUB, username)
+        new_events = takewhile(lambda event: not cursor or event["created_at"] >= cursor, iter_github_events(username))
+
+        count, latest = 0, cursor
+        for batch in batches(new_events, SYNC_BATCH_SIZE):
+            count += self.upsert(GITHUB, username, batch, "id", "created_at")
+            latest = max(filter(None, [latest, *(event["created_at"] for event in batch)]))
+        self.set_cursor(GITHUB, username, latest)
+        return count
+
+    def sync_linear(self, username, user_email, api_key, api_url):
+        """
+        Fetch Linear issues updated since the stored cursor, storing them in batches as they
+        stream in. The cursor only advances once every page has been read, so a failed sync
+        is retried from the same point; the batches it already stored are simply replaced.
+        """
+        cursor = self.get_cursor(LINEAR, username)
+        if not cursor:
+            since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=INITIAL_LOOKBACK_DAYS)
+            cursor = since.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+        user_id = fetch_linear_user_id(user_email, api_key, api_url)
+        if not user_id:
+            raise ValueError("Failed to retrieve Linear user ID.")
+
+        count, latest = 0, cursor
+        for batch in batches(iter_linear_user_activities_since(user_id, api_key, api_url, cursor), SYNC_BATCH_SIZE):
+            count += self.upsert(LINEAR, username, batch, "id", "updatedAt")
+            self.upsert(LINEAR_EVENT, username, linear_issue_events(batch), "id", "occurredAt", parent_key="issueId")
+            latest = max(latest, *(issue["updatedAt"] for issue in batch))
+        self.set_cursor(LINEAR, username, latest)
+        return count
+
+    def sync_user(self, username, user_email, api_key, api_url):
+        """
+        Incrementally sync both sources for a user. A failing source is logged and skipped,
+        so the store keeps serving what it already has while an upstream API is down.
+        """
+        for source, sync in ((GITHUB, lambda: self.sync_github(username)),
+                             (LINEAR, lambda: self.sync_linear(username, user_email, api_key, api_url))):
+            try:
+                count = sync()
+                print(f"Synced {count} {source} records for user: {username}")
+            except Exception as e:
+                print(f"Error syncing {source} activity for user {username}: {e}")
+
+def batches(records, size):
+    """Yield lists of up to size records from an iterable, so a sync holds one batch in memory at a time."""
+    iterator = iter(records)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+def linear_issue_events(issues):
+    """Yield a dated marker for the creation and for each comment of the given Linear issues."""
+    for issue in issues:
+        yield {"id": f"{issue['id']}:created", "issueId": issue["id"], "kind": "created", "occurredAt": issue["createdAt"]}
+        for comment in issue.get("comments", {}).get("nodes", []):
+            yield {"id": comment["id"], "issueId": issue["id"], "kind": "comment", "occurredAt": comment["createdAt"]}
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_activity_store():
+    """Return the process-wide ActivityStore, located by the ACTIVITY_STORE_PATH environment variable."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ActivityStore(os.getenv("ACTIVITY_STORE_PATH", "activity.db"))
+    return _store
+
+async def activity_sync_loop(settings_provider, interval_seconds):
+    """
+    Background job: sync the configured user every interval_seconds.
+    settings_provider returns (username, user_email, api_key, api_url).
+    """
+    store = get_activity_store()
+    while True:
+        try:
+            username, user_email, api_key, api_url = settings_provider()
+            await asyncio.to_thread(store.sync_user, username, user_email, api_key, api_url)
+        except Exception as e:
+            print(f"Error in activity sync loop: {e}")
+        await asyncio.sleep(interval_seconds)
@@ -0,0 +1,188 @@
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from functools import lru_cache
+
+import tiktoken
+
+####################################################################################################################################
+# ADMISSION CONTROL FOR LLM-BACKED TURNS
+####################################################################################################################################
+
+# Tokens the chat format adds around every message
+TOKENS_PER_MESSAGE = 4
+
+@lru_cache(maxsize=None)
+def get_encoding():
+    """
+    Tokenizer used by gpt-4o; only used to estimate prompt size before a call.
+    Returns None if the tokenizer files cannot be loaded. The result, including that
+    failure, is cached, so the blocking download is attempted once. Call it at startup.
+    """
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        print(f"Error loading tokenizer, using a character estimate: {e}")
+        return None
+
+def estimate_tokens(*texts) -> int:
+    """Estimates the number of prompt tokens of the given texts."""
+    encoding = get_encoding()
+    if encoding is None:
+        # Roughly four characters per token
+        return sum(len(text or "") for text in texts) // 4
+    return sum(len(encoding.encode(text or "")) for text in texts)
+
+def estimate_messages_tokens(messages) -> int:
+    """Estimates the number of prompt tokens of a list of chat messages."""
+    return sum(estimate_tokens(str(message.content)) + TOKENS_PER_MESSAGE for message in messages)
+
+class AdmissionRejected(Exception):
+    """Raised when a turn cannot be admitted before its deadline."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+class TokenBucket:
+    """Token bucket holding up to `capacity` tokens, refilled continuously at `capacity` per minute."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.rate = capacity / 60.0
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_consume(self, amount: int) -> bool:
+        self._refill()
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True
+        return False
+
+    def refund(self, amount: int):
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def charge(self, amount: int):
+        """Deducts tokens unconditionally, going into debt if needed; a negative amount refunds."""
+        if amount < 0:
+            self.refund(-amount)
+            return
+        self._refill()
+        self.tokens -= amount
+
+    def seconds_until(self, amount: int) -> float:
+        self._refill()
+        return max(amount - self.tokens, 0.0) / self.rate
+
+class AdmissionController:
+    """
+    Decides whether an LLM-backed turn may run, and when.
+
+    A turn must pass three gates, queueing at each one until its deadline:
+    - the user's token bucket (per-user tokens-per-minute share)
+    - the global token bucket (the deployment's tokens-per-minute budget)
+    - the global concurrency semaphore
+    The cost of the first LLM call is estimated from the prompt size before the turn.
+    Every LLM call of the turn is then charged through charge() and settled against
+    its actual usage when it ends (see AdmissionCallbackHandler), so multi-step turns
+    put both buckets into debt and later turns wait. A turn that misses its deadline
+    or is cancelled while waiting has its tokens refunded.
+    """
+
+    def __init__(self, max_concurrent_turns: int, tokens_per_minute: int, user_tokens_per_minute: int, deadline_seconds: float):
+        self.semaphore = asyncio.Semaphore(max_concurrent_turns)
+        self.global_bucket = TokenBucket(tokens_per_minute)
+        self.user_tokens_per_minute = user_tokens_per_minute
+        self.user_buckets = {}
+        self.deadline_seconds = deadline_seconds
+        self.metrics = {
+            "admitted": 0,
+            "rejected": {},
+            "in_flight": 0,
+            "queue_wait_seconds_total": 0.0,
+            "queue_wait_seconds_max": 0.0,
+            "charged_tokens": 0,
+            "refunded_tokens": 0,
+        }
+
+    def _user_bucket(self, user_id: str) -> TokenBucket:
+        if user_id not in self.user_buckets:
+            self.user_buckets[user_id] = TokenBucket(self.user_tokens_per_minute)
+        return self.user_buckets[user_id]
+
+    def _reject(self, reason: str):
+        self.metrics["rejected"][reason] = self.metrics["rejected"].get(reason, 0) + 1
+        print(f"Admission rejected: {reason}")
+        raise AdmissionRejected(reason)
+
+    async def _wait_for_tokens(self, bucket: TokenBucket, amount: int, deadline: float) -> bool:
+        while not bucket.try_consume(amount):
+            wait = bucket.seconds_until(amount)
+            if time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+        return True
+
+    @asynccontextmanager
+    async def admit(self, user_id: str, estimated_tokens: int):
+        """Waits until the turn may run, then holds a concurrency slot for its duration."""
+        start = time.monotonic()
+        deadline = start + self.deadline_seconds
+        user_bucket = self._user_bucket(user_id)
+
+        if estimated_tokens > user_bucket.capacity or estimated_tokens > self.global_bucket.capacity:
+            self._reject("too_large")
+        # Buckets the turn has taken its tokens from, refunded if it does not get to run,
+        # including when it is cancelled while it waits
+        consumed = []
+        try:
+            if not await self._wait_for_tokens(user_bucket, estimated_tokens, deadline):
+                self._reject("user_rate_limited")
+            consumed.append(user_bucket)
+            if not await self._wait_for_tokens(self.global_bucket, estimated_tokens, deadline):
+                self._reject("tpm_budget")
+            consumed.append(self.global_bucket)
+            try:
+                await asyncio.wait_for(self.semaphore.acquire(), timeout=max(deadline - time.monotonic(), 0))
+            except asyncio.TimeoutError:
+                self._reject("concurrency")
+        except BaseException:
+            for bucket in consumed:
+                bucket.refund(estimated_tokens)
+            raise
+
+        waited = time.monotonic() - start
+        self.metrics["admitted"] += 1
+        self.metrics["queue_wait_seconds_total"] += waited
+        self.metrics["queue_wait_seconds_max"] = max(self.metrics["queue_wait_seconds_max"], waited)
+        self.metrics["in_flight"] += 1
+        try:
+            yield
+        finally:
+            self.metrics["in_flight"] -= 1
+            self.semaphore.release()
+
+    def charge(self, user_id: str, amount: int):
+        """Charges tokens used by an admitted turn to the user's and the global bucket; a negative amount refunds."""
+        self._user_bucket(user_id).charge(amount)
+        self.global_bucket.charge(amount)
+        if amount > 0:
+            self.metrics["charged_tokens"] += amount
+        else:
+            self.metrics["refunded_tokens"] -= amount
+
+    def snapshot(self) -> dict:
+        """Returns a copy of the admission metrics."""
+        admitted = self.metrics["admitted"]
+        return {
+            **self.metrics,
+            "rejected": dict(self.metrics["rejected"]),
+            "queue_wait_seconds_avg": self.metrics["queue_wait_seconds_total"] / admitted if admitted else 0.0,
+        }
@@ -1,7 +1,11 @@
 import sys
-from typing import Any, Dict, List, Optional, Union
+import json
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+from uuid import UUID
 from langchain.callbacks.base import BaseCallbackHandler
-from langchain.schema import AgentAction, AgentFinish, LLMResult
+from langchain.schema import AgentAction, AgentFinish, BaseMessage, LLMResult
+from common.admission import estimate_messages_tokens, estimate_tokens
 
 
 
@@ -29,4 +33,144 @@ class StdOutCallbackHandler(BaseCallbackHandler):
     def on_agent_action(self, action: AgentAction, **kwargs: Any) -> Any:
         sys.stdout.write(f"Agent Action: {action.log}\n")
                
-            
\ No newline at end of file
+            
+
+# Callback handler that reports how much wall-clock time concurrent tool dispatch saves
+class ToolTimingCallbackHandler(BaseCallbackHandler):
+    """Callback handler that times the tool calls of each agent step.
+    The async AgentExecutor runs the tool calls of a single step concurrently.
+    A step is the set of top-level tool runs that are in flight together; tools
+    nested anywhere below another tool (e.g. the inner agent of sqlsearch) are
+    part of that tool's time and are not counted. Once the last one finishes, the handler writes the step's wall-clock time next to the
+    time the same calls would have taken one after another.
+    Create one instance per turn, the state is not shared between conversations.
+    """
+
+    # Run inline on the event loop so start/end events are seen in order
+    run_inline = True
+
+    def __init__(self) -> None:
+        # Parent of every chain and tool run seen, to tell nested tools apart
+        self.parents: Dict[UUID, Optional[UUID]] = {}
+        self.tool_runs: set = set()
+        self.in_flight: Dict[UUID, float] = {}
+        self.step_durations: List[float] = []
+        self.step_start: Optional[float] = None
+        self.total_saved = 0.0
+
+    def on_chain_start(self, serialized: Dict[str, Any], inputs: Dict[str, Any], *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any) -> Any:
+        self.parents[run_id] = parent_run_id
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any) -> Any:
+        self.parents[run_id] = parent_run_id
+        self.tool_runs.add(run_id)
+        # Tools called from inside another tool are part of that tool's time
+        if self._has_tool_ancestor(run_id):
+            return
+        now = time.perf_counter()
+        if not self.in_flight:
+            self.step_start = now
+            self.step_durations = []
+        self.in_flight[run_id] = now
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> Any:
+        self._finish_tool(run_id)
+
+    def on_tool_error(self, error: Union[Exception, KeyboardInterrupt], *, run_id: UUID, **kwargs: Any) -> Any:
+        self._finish_tool(run_id)
+
+    def on_chain_end(self, outputs: Dict[str, Any], *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any) -> Any:
+        if parent_run_id is None:
+            sys.stdout.write(f"Turn tool time saved by parallel dispatch: {self.total_saved:.2f}s\n")
+
+    def _has_tool_ancestor(self, run_id: UUID) -> bool:
+        parent = self.parents.get(run_id)
+        while parent is not None:
+            if parent in self.tool_runs:
+                return True
+            parent = self.parents.get(parent)
+        return False
+
+    def _finish_tool(self, run_id: UUID) -> None:
+        started = self.in_flight.pop(run_id, None)
+        if started is None:
+            return
+        now = time.perf_counter()
+        self.step_durations.append(now - started)
+        if self.in_flight:
+            return
+
+        wall = now - self.step_start
+        sequential = sum(self.step_durations)
+        saved = max(sequential - wall, 0.0)
+        self.total_saved += saved
+        sys.stdout.write(
+            f"Tool step: {len(self.step_durations)} call(s), wall {wall:.2f}s, "
+            f"sequential {sequential:.2f}s, saved {saved:.2f}s\n"
+        )
+
+
+# Callback handler that charges every LLM call of a turn to the admission controller
+class AdmissionCallbackHandler(BaseCallbackHandler):
+    """Callback handler that charges each chat model call of an admitted turn.
+    The turn was admitted with an estimate of its first call. When a call starts,
+    including the calls of nested agents such as sqlsearch, it is charged the estimate
+    of the messages it sends plus the full completion budget; the first call only pays
+    what exceeds the admitted estimate. When the call ends the charge is settled
+    against its actual usage: the token_usage in llm_output or the message's
+    usage_metadata when the model reports them, otherwise an estimate of the generated
+    text. Unused tokens go back to the buckets.
+    Create one instance per turn, the state is not shared between conversations.
+    """
+
+    # Run inline on the event loop so charges land before the request goes out
+    run_inline = True
+
+    def __init__(self, controller: Any, user_id: str, reserved_tokens: int, completion_tokens: int) -> None:
+        self.controller = controller
+        self.user_id = user_id
+        self.reserved_tokens = reserved_tokens
+        self.completion_tokens = completion_tokens
+        self.llm_calls = 0
+        # Prompt estimate and total charge of every call still running
+        self.charged: Dict[UUID, Tuple[int, int]] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[BaseMessage]], *, run_id: UUID, **kwargs: Any) -> Any:
+        prompt_tokens = sum(estimate_messages_tokens(prompt) for prompt in messages)
+        cost = prompt_tokens + self.completion_tokens
+        self.charged[run_id] = (prompt_tokens, cost)
+        if self.llm_calls == 0:
+            # The first call was paid for at admission
+            cost -= self.reserved_tokens
+        self.llm_calls += 1
+        self.controller.charge(self.user_id, cost)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> Any:
+        if run_id not in self.charged:
+            return
+        prompt_tokens, charged = self.charged.pop(run_id)
+        self.controller.charge(self.user_id, self._actual_tokens(response, prompt_tokens) - charged)
+
+    def on_llm_error(self, error: Union[Exception, KeyboardInterrupt], *, run_id: UUID, **kwargs: Any) -> Any:
+        if run_id not in self.charged:
+            return
+        # Nothing was generated, give back the completion budget
+        self.charged.pop(run_id)
+        self.controller.charge(self.user_id, -self.completion_tokens)
+
+    def _actual_tokens(self, response: LLMResult, prompt_tokens: int) -> int:
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if usage.get("total_tokens"):
+            return usage["total_tokens"]
+
+        total = 0
+        for generation in (generation for generations in response.generations for generation in generations):
+            message = getattr(generation, "message", None)
+            usage_metadata = getattr(message, "usage_metadata", None)
+            if usage_metadata:
+                total += usage_metadata["total_tokens"]
+            else:
+                # Streaming responses without usage: estimate the generated text and tool calls
+                tool_calls = getattr(message, "tool_calls", None) or []
+                total += prompt_tokens + estimate_tokens(generation.text, json.dumps(tool_calls, default=str))
+        return total
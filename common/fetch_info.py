@@ -1,4 +1,8 @@
 import requests
+import ijson
+from ijson.common import ObjectBuilder
+import asyncio
+import asyncpg
 import os
 import json
 # from datetime import datetime
@@ -8,6 +12,18 @@ import datetime  # Ensure this import is at the top of your file
 
 dotenv.load_dotenv("../credentials.env")
 
+# Database connection parameters
+DB_NAME = "dailypulse"
+DB_USER = "postgres"
+DB_PASSWORD = "admin"
+DB_HOST = "localhost"
+DB_PORT = "5432"
+
+# SQL query to fetch the last row for the given user
+LAST_UPDATE_QUERY = """
+SELECT * FROM dailypulse WHERE username = %s ORDER BY date DESC LIMIT 1;
+"""
+
 # GraphQL Query to fetch user ID dynamically
 USER_QUERY = """
 query GetUserByEmail($email: String!) {
@@ -21,10 +37,15 @@ query GetUserByEmail($email: String!) {
 }
 """
 
-# GraphQL Query to fetch issues associated with a user
-ACTIVITIES_QUERY = """
-query UserActivities($userId: ID!) {
-    issues(filter: {assignee: {id: {eq: $userId}}}) {
+# GraphQL Query to fetch one page of the issues associated with a user that changed after a timestamp.
+# pageInfo is requested before nodes so it can be read while the nodes are streamed.
+ACTIVITIES_SINCE_QUERY = """
+query UserActivitiesSince($userId: ID!, $since: DateTimeOrDuration!, $after: String) {
+    issues(first: 50, after: $after, orderBy: updatedAt, filter: {assignee: {id: {eq: $userId}}, updatedAt: {gt: $since}}) {
+        pageInfo {
+            hasNextPage
+            endCursor
+        }
         nodes {
             id
             title
@@ -35,6 +56,7 @@ query UserActivities($userId: ID!) {
             }
             comments {
                 nodes {
+                    id
                     body
                     createdAt
                 }
@@ -72,67 +94,101 @@ def fetch_linear_user_id(email, api_key, api_url):
 
     return users[0]["id"]  # Return the first user's ID
 
-def filter_linear_issues(issues, target_date):
+# JSON path of the event array in the GitHub events response
+GITHUB_EVENTS_PATH = "item"
+
+def iter_records(stream, path):
     """
-    Filter all the Linear issues based on the target date.
+    Incrementally parse the JSON array at path from a file-like stream and yield its
+    records. Only one record is materialised at a time, so memory stays bounded by
+    the largest record instead of the whole response body.
     """
-    filtered_issues = []
-    target_date_obj = datetime.datetime.strptime(target_date, "%Y-%m-%d").date()
-
-    for issue in issues:
-        issue_date = datetime.datetime.fromisoformat(issue['createdAt'].replace("Z", "+00:00")).date()
-        if issue_date == target_date_obj:
-            filtered_issues.append(issue)
+    yield from ijson.items(stream, path, use_float=True)
 
-    return filtered_issues
+def iter_connection_nodes(stream, connection_path, page_info):
+    """
+    Incrementally parse a GraphQL connection at connection_path from a file-like stream.
+    Yields its nodes one at a time and fills page_info with the connection's pageInfo.
+    """
+    nodes_path = f"{connection_path}.nodes.item"
+    page_info_path = f"{connection_path}.pageInfo"
+    builder = None
+    building = None
+    for prefix, event, value in ijson.parse(stream, use_float=True):
+        if builder is None:
+            if event == "start_map" and prefix in (nodes_path, page_info_path):
+                builder = ObjectBuilder()
+                building = prefix
+                builder.event(event, value)
+            continue
+
+        builder.event(event, value)
+        if event == "end_map" and prefix == building:
+            if building == nodes_path:
+                yield builder.value
+            else:
+                page_info.update(builder.value)
+            builder = None
 
-def fetch_linear_user_activities(user_id, api_key, api_url, target_date=None):
-    # Set up headers
+def iter_linear_user_activities_since(user_id, api_key, api_url, since):
+    """
+    Stream the Linear issues of a user updated after the given ISO timestamp, across all pages.
+    Raises ValueError if an API call fails, so callers never see a silently truncated result.
+    """
     headers = {
         "Authorization": api_key,
         "Content-Type": "application/json"
     }
+    after = None
 
-    # Variables for the query
-    variables = {
-        "userId": user_id
-    }
-
-    # Make the request
-    response = requests.post(api_url, headers=headers, json={"query": ACTIVITIES_QUERY, "variables": variables})
-
-    # Check for errors
-    if response.status_code != 200:
-        print(f"Error fetching user activities: {response.status_code}, {response.text}")
-        return None
-
-    data = response.json()
-    issues = data.get("data", {}).get("issues", {}).get("nodes", [])
-
-    if target_date:
-        issues = filter_linear_issues(issues, target_date)
-
-    return issues
-
-def fetch_github_events(username: str, target_date: str) -> str:  
-    """  
-    Fetch GitHub events for the user on the given date and return them as a human-readable string.  
-    """    
-    url = f"https://api.github.com/users/{username}/events/public"  
-    response = requests.get(url)  
-    if response.status_code != 200:  
-        print(f"Error: Received status code {response.status_code}")  
-        raise ValueError(f"Error: Received status code {response.status_code}")  
-  
-    events = response.json() 
-    filtered_events = [  
-        event for event in events  
-        if datetime.datetime.fromisoformat(event['created_at'].replace("Z", "+00:00")).date() == datetime.datetime.strptime(target_date, "%Y-%m-%d").date()  
-    ]  
-  
+    while True:
+        variables = {
+            "userId": user_id,
+            "since": since,
+            "after": after
+        }
+        page_info = {}
+        with requests.post(api_url, headers=headers, json={"query": ACTIVITIES_SINCE_QUERY, "variables": variables}, stream=True) as response:
+            if response.status_code != 200:
+                print(f"Error fetching user activities: {response.status_code}, {response.text}")
+                raise ValueError(f"Error fetching user activities: {response.status_code}")
+
+            response.raw.decode_content = True
+            yield from iter_connection_nodes(response.raw, "data.issues", page_info)
+
+        if not page_info:
+            raise ValueError("Error fetching user activities: no pageInfo in the Linear response")
+        if not page_info.get("hasNextPage"):
+            return
+        after = page_info["endCursor"]
+
+def iter_github_events(username: str, pages: int = 3, per_page: int = 100):
+    """
+    Stream the public GitHub events of a user, newest first, across up to `pages` pages.
+    Raises ValueError if the API call fails.
+    """
+    url = f"https://api.github.com/users/{username}/events/public"
+    for page in range(1, pages + 1):
+        with requests.get(url, params={"per_page": per_page, "page": page}, stream=True) as response:
+            if response.status_code != 200:
+                print(f"Error: Received status code {response.status_code}")
+                raise ValueError(f"Error: Received status code {response.status_code}")
+
+            response.raw.decode_content = True
+            count = 0
+            for event in iter_records(response.raw, GITHUB_EVENTS_PATH):
+                count += 1
+                yield event
+        if count < per_page:
+            return
+
+def format_github_events(events) -> str:
+    """
+    Format GitHub events as a human-readable string. Callers filter the events by date beforehand.
+    """
     # Process events and extract details  
     event_details = []  
-    for event in filtered_events:  
+    for event in events:  
         event_type = event['type']  
         repo_name = event['repo']['name']  
         event_date = datetime.datetime.fromisoformat(event['created_at'].replace("Z", "+00:00")).strftime('%Y-%m-%d %H:%M:%S')  
@@ -185,58 +241,35 @@ def fetch_github_events(username: str, target_date: str) -> str:
     # Combine all events into a single formatted string  
     return "\n\n".join(event_details)
 
-def fetch_github_and_linear_events(user_email, github_username, api_key, api_url, target_date):
-    # Fetch Linear user ID
-    user_id = fetch_linear_user_id(user_email, api_key, api_url)
-    if not user_id:
-        print("Failed to retrieve Linear user ID.")
-        return "Failed to retrieve Linear user ID."
-
-    # Fetch Linear activities
-    linear_activities = fetch_linear_user_activities(user_id, api_key, api_url, target_date)
-    if not linear_activities:
-        print("No Linear activities found.")
-        linear_activities = []
-
-    # Fetch GitHub events
-    github_events = fetch_github_events(github_username, target_date)
-    if not github_events:
-        print("No GitHub events found.")
-        github_events = ""
-
-    # Combine results into a string
-    combined_events = f"Linear Activities:\n{json.dumps(linear_activities, indent=2)}\n\nGitHub Events:\n{github_events}"
+def format_sql_row(result_dict):
+    """
+    Convert a dailypulse row to a string with column names and values in a key-value pair format.
+    """
+    # Convert date objects to strings
+    for key, value in result_dict.items():
+        if isinstance(value, (datetime.date, datetime.datetime)):
+            result_dict[key] = value.isoformat()
 
-    return combined_events
+    # Convert the dictionary to a string format
+    return json.dumps(result_dict, indent=2)
 
 def fetch_last_sql_update(username):
     """
     Fetch the last row (most recent date) for a given user from the dailypulse table.
     Return the result as a string with column names and values in a key-value pair format.
     """
-    # Database connection parameters
-    db_name = "dailypulse"
-    db_user = "postgres"
-    db_password = "admin"
-    db_host = "localhost"
-    db_port = "5432"
-
     # Connect to the database
     conn = psycopg2.connect(
-        dbname=db_name,
-        user=db_user,
-        password=db_password,
-        host=db_host,
-        port=db_port
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        host=DB_HOST,
+        port=DB_PORT
     )
 
     try:
         with conn.cursor() as cursor:
-            # SQL query to fetch the last row for the given user
-            query = """
-            SELECT * FROM dailypulse WHERE username = %s ORDER BY date DESC LIMIT 1;
-            """
-            cursor.execute(query, (username,))
+            cursor.execute(LAST_UPDATE_QUERY, (username,))
             result = cursor.fetchone()
 
             if result:
@@ -244,23 +277,61 @@ def fetch_last_sql_update(username):
                 colnames = [desc[0] for desc in cursor.description]
                 # Combine column names and values into a dictionary
                 result_dict = dict(zip(colnames, result))
-                
-                # Convert date objects to strings
-                for key, value in result_dict.items():
-                    if isinstance(value, (datetime.date, datetime.datetime)):
-                        result_dict[key] = value.isoformat()
-                
-                # Convert the dictionary to a string format
-                return json.dumps(result_dict, indent=2)
+                return format_sql_row(result_dict)
             else:
                 print(f"No records found for user: {username}")
-                return "No records found for user: {username}"
+                return f"No records found for user: {username}"
     except Exception as e:
         print(f"Error fetching last SQL update: {e}")
         return f"Error fetching last SQL update: {e}"
     finally:
         conn.close()
 
+####################################################################################################################################
+# ASYNC VARIANTS (asyncpg) USED BY THE ASYNC AGENT EXECUTION PATH
+####################################################################################################################################
+
+# Shared asyncpg pool, created on first use so that concurrent conversations reuse connections
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+_db_pool = None
+_db_pool_lock = asyncio.Lock()
+
+async def get_db_pool():
+    """
+    Return the process-wide asyncpg connection pool for the dailypulse database.
+    """
+    global _db_pool
+    async with _db_pool_lock:
+        if _db_pool is None:
+            _db_pool = await asyncpg.create_pool(
+                database=DB_NAME,
+                user=DB_USER,
+                password=DB_PASSWORD,
+                host=DB_HOST,
+                port=int(DB_PORT),
+                min_size=1,
+                max_size=DB_POOL_MAX_SIZE
+            )
+    return _db_pool
+
+async def afetch_last_sql_update(username):
+    """
+    Async version of fetch_last_sql_update using the shared asyncpg pool.
+    """
+    try:
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            # asyncpg uses $1-style placeholders
+            result = await conn.fetchrow(LAST_UPDATE_QUERY.replace("%s", "$1"), username)
+        if result:
+            return format_sql_row(dict(result))
+        else:
+            print(f"No records found for user: {username}")
+            return f"No records found for user: {username}"
+    except Exception as e:
+        print(f"Error fetching last SQL update: {e}")
+        return f"Error fetching last SQL update: {e}"
+
 def main():
     USERNAME = os.getenv("GITHUB_USERNAME")  # Assuming the username is stored in the environment variable
 
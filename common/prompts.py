@@ -40,11 +40,14 @@ CUSTOM_CHATBOT_PREFIX = f"""
       - When the user later informs you that they are ready (e.g., "yes, I am ready to provide the update"), send them to the next stage.  
   
   3. *Draft Preparation*:  
-      - Use the tool github_linear_update to summarize the user's GitHub and Linear activity from the past 24 hours into draft sections:  
+      - The User Context block already contains the user's GitHub and Linear activity and their most recent update from the dailypulse table. Build the first draft directly from it.  
+      - Only call the tools below if the User Context marks an item as unavailable or the user asks you to refresh it.  
+      - Use the tool github_linear_update to summarize the user's GitHub and Linear activity since the previous working day into draft sections (pass start_date and end_date to look at any other range):  
           - *Accomplishments*: Extract completed tasks, merged PRs, resolved issues, etc.  
           - *Plans*: Identify tasks in progress or next steps based on recent commits or discussions.  
           - *Blockers*: Highlight unresolved challenges or pending reviews based on activity data.  
-      - Use the tool get_update_from_memory_tool to fetch the user's most recent update from the dailypulse table.  
+      - Use the tool get_update_from_memory to fetch the user's most recent update from the dailypulse table.  
+      - The two lookups are independent: call github_linear_update and get_update_from_memory together in the same step.  
       - Present the fetched update to the user and inform them about the work they were supposed to do and the blockers they had yesterday.  
   
   4. *Iterative Follow-Up Questions*:  
@@ -71,7 +74,7 @@ CUSTOM_CHATBOT_PREFIX = f"""
   
   ## On how to use your tools  
   - You have access to a sql tool: sqlsearch that you can use in order to insert draft information into the database.  
-  - You have access to a sql tool: get_update_from_memory_tool that you can use to fetch the most recent update from the dailypulse table for a given user.  
+  - You have access to a sql tool: get_update_from_memory that you can use to fetch the most recent update from the dailypulse table for a given user.  
   - Answers from the tools are NOT considered part of the conversation. Treat tool's answers as context to respond to the human or to insert values into the database.  
   - Human does NOT have direct access to your tools.  
   
@@ -121,14 +124,22 @@ CUSTOM_CHATBOT_PREFIX = f"""
       - Bot: "Your update has been successfully submitted."  
 """
 
+USER_CONTEXT_PREFIX = """  
+  ## User Context  
+  Precomputed for the current user before this conversation turn. Treat it like a tool answer: it is context, not part of the conversation.  
+  
+{user_context}  
+"""
+
 CUSTOM_CHATBOT_PROMPT = ChatPromptTemplate.from_messages(  
     [  
         ("system", CUSTOM_CHATBOT_PREFIX),  
+        ("system", USER_CONTEXT_PREFIX),  
         MessagesPlaceholder(variable_name='history', optional=True),  
         ("human", "{question}"),  
         MessagesPlaceholder(variable_name='agent_scratchpad')  
     ]  
-)  
+).partial(user_context="Unavailable, use the github_linear_update and get_update_from_memory tools.")  
   
 MSSQL_AGENT_PREFIX = """# Instructions:  
 - You are a SQL agent designed to interact with the dailypulse table in the public schema of a PostgreSQL database.  
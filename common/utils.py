@@ -1,5 +1,9 @@
 from typing import Optional, Type  
+import asyncio  
+import datetime  
+import json  
 import os  
+import time  
 from sqlalchemy.engine.url import URL  
 from langchain.pydantic_v1 import BaseModel, Field, Extra  
 from langchain.tools import BaseTool  
@@ -7,7 +11,12 @@ from langchain.sql_database import SQLDatabase
 from langchain_community.agent_toolkits import SQLDatabaseToolkit, create_sql_agent  
 from langchain_openai import AzureChatOpenAI  
 from langchain.callbacks.manager import CallbackManagerForToolRun, AsyncCallbackManagerForToolRun   
-from common.fetch_info import fetch_github_and_linear_events, fetch_last_sql_update
+from common.fetch_info import (  
+    fetch_last_sql_update,  
+    afetch_last_sql_update,  
+    format_github_events,  
+)
+from common.activity_store import get_activity_store, GITHUB, LINEAR
   
 try:  
     from .prompts import MSSQL_AGENT_PREFIX  
@@ -15,10 +24,89 @@ except ImportError as e:
     print(e)  
     from prompts import MSSQL_AGENT_PREFIX  
   
+####################################################################################################################################  
+# HELPERS  
+####################################################################################################################################  
+  
+def get_report_range(today=None):  
+    """Returns the (start_date, end_date) a standup covers: the previous working day through yesterday.  
+  
+    On a Monday this spans Friday to Sunday, so weekend activity is caught up.  
+    """  
+    today = today or datetime.date.today()  
+    end = today - datetime.timedelta(days=1)  
+    start = end  
+    while start.weekday() >= 5:  
+        start -= datetime.timedelta(days=1)  
+    return start.isoformat(), end.isoformat()  
+  
+def get_github_linear_settings():  
+    """Reads and validates the GitHub/Linear settings from the environment."""  
+    username = os.getenv("GITHUB_USERNAME")
+    user_email = os.getenv("LINEAR_USER_EMAIL")
+    api_key = os.getenv("LINEAR_API_KEY")
+    api_url = os.getenv("LINEAR_API_URL")
+    
+    if not username:  
+        print("Error: GITHUB_USERNAME environment variable is not set")  
+        raise ValueError("GITHUB_USERNAME environment variable is not set")  
+    if not user_email:
+        print("Error: USER_EMAIL environment variable is not set")
+        raise ValueError("USER_EMAIL environment variable is not set")
+    if not api_key:
+        print("Error: API_KEY environment variable is not set")
+        raise ValueError("API_KEY environment variable is not set")
+  
+    return username, user_email, api_key, api_url  
+  
+NOT_SYNCED = "Unavailable, the background sync has not completed for this source yet."  
+  
+def load_activity(username, start_date, end_date):  
+    """Reads a user's activity for a date range from the local activity store.  
+  
+    Returns (linear_issues, github_events); a source the background sync has not completed  
+    for yet is None. Only the local store is read, upstream APIs are never called inline.  
+    """  
+    store = get_activity_store()  
+    linear_issues, github_events = store.activity_between(username, start_date, end_date)  
+    if not store.has_synced(username, LINEAR):  
+        linear_issues = None  
+    if not store.has_synced(username, GITHUB):  
+        github_events = None  
+    return linear_issues, github_events  
+  
+def format_activity(linear_issues, github_events) -> str:  
+    """Formats stored activity as Linear issues (JSON) followed by the GitHub event details."""  
+    linear_text = NOT_SYNCED if linear_issues is None else json.dumps(linear_issues, indent=2)  
+    github_text = NOT_SYNCED if github_events is None else format_github_events(github_events)  
+    return f"Linear Activities:\n{linear_text}\n\nGitHub Events:\n{github_text}"  
+  
+async def run_with_timeout(coro, timeout: float, tool_name: str) -> str:  
+    """Awaits a tool coroutine, cancelling it if it runs past its timeout.  
+  
+    The timeout is reported back as the tool's answer instead of being raised, so that  
+    the other tool calls dispatched in the same agent step still complete.  
+    """  
+    try:  
+        return await asyncio.wait_for(coro, timeout=timeout)  
+    except asyncio.TimeoutError:  
+        print(f"Error: {tool_name} timed out after {timeout} seconds")  
+        return f"Error: {tool_name} timed out after {timeout} seconds"  
+  
 ####################################################################################################################################  
 # AGENTS AND TOOL CLASSES  
 ####################################################################################################################################  
   
+class ActivityRangeInput(BaseModel):  
+    start_date: Optional[str] = Field(  
+        description="First day of the range in YYYY-MM-DD format. Defaults to the previous working day.",  
+        default=None,  
+    )  
+    end_date: Optional[str] = Field(  
+        description="Last day of the range in YYYY-MM-DD format, inclusive. Defaults to yesterday.",  
+        default=None,  
+    )  
+  
 class SearchInput(BaseModel):  
     query: str = Field(description="should be a search query")  
     return_direct: bool = Field(  
@@ -34,6 +122,7 @@ class SQLSearchAgent(BaseTool):
     args_schema: Type[BaseModel] = SearchInput  
     llm: AzureChatOpenAI  
     k: int = 10  
+    timeout: float = 120  
   
     class Config:  
         extra = Extra.allow  # Allows setting attributes not declared in the model  
@@ -73,62 +162,203 @@ class SQLSearchAgent(BaseTool):
         except Exception as e:  
             print(e)  
             return str(e)  # Return an error indicator  
+        finally:  
+            # The query may have written a new dailypulse row  
+            invalidate_user_context(os.getenv("GITHUB_USERNAME"))  
   
     async def _arun(self, query: str, return_direct=False, run_manager: Optional[AsyncCallbackManagerForToolRun] = None) -> str:  
         # Note: Implementation assumes the agent_executor and its methods support async operations  
         try:  
             # Use the initialized agent_executor to asynchronously invoke the query  
-            result = await self.agent_executor.ainvoke(query)  
+            result = await run_with_timeout(self.agent_executor.ainvoke(query), self.timeout, self.name)  
+            if isinstance(result, str):  
+                return result  
             return result['output']  
         except Exception as e:  
             print(e)  
             return str(e)  # Return an error indicator  
+        finally:  
+            # The query may have written a new dailypulse row  
+            invalidate_user_context(os.getenv("GITHUB_USERNAME"))  
   
 class Github_Linear_UpdateTool(BaseTool):  
     name = "github_linear_update"  
-    description = "Fetches GitHub and Linear updates for the given username from the environment variable for yesterday's date"  
+    description = "Fetches GitHub and Linear updates for the given username from the environment variable for the previous working day, or for a given date range"  
+    args_schema: Type[BaseModel] = ActivityRangeInput  
+    timeout: float = 30  
   
-    def _run(self) -> str:  
+    def _run(self, start_date: Optional[str] = None, end_date: Optional[str] = None) -> str:  
         """Use the tool."""  
         print("Running Github_Linear_UpdateTool")  
-        username = os.getenv("GITHUB_USERNAME")
-        user_email = os.getenv("LINEAR_USER_EMAIL")
-        api_key = os.getenv("LINEAR_API_KEY")
-        api_url = os.getenv("LINEAR_API_URL")
-        
-        if not username:  
-            print("Error: GITHUB_USERNAME environment variable is not set")  
-            raise ValueError("GITHUB_USERNAME environment variable is not set")  
-        if not user_email:
-            print("Error: USER_EMAIL environment variable is not set")
-            raise ValueError("USER_EMAIL environment variable is not set")
-        if not api_key:
-            print("Error: API_KEY environment variable is not set")
-            raise ValueError("API_KEY environment variable is not set")
-  
-        # yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")  
-        yesterday = "2025-01-13"
-        print(f"Fetching GitHub and Linear events for user: {username} on date: {yesterday}")  
-        events = fetch_github_and_linear_events(user_email, username, api_key, api_url, yesterday)  
+        username, _, _, _ = get_github_linear_settings()  
+        default_start, default_end = get_report_range()  
+        try:  
+            start = datetime.date.fromisoformat(start_date or default_start)  
+            end = datetime.date.fromisoformat(end_date or default_end)  
+        except ValueError:  
+            print(f"Error: invalid date range {start_date!r} to {end_date!r}")  
+            return f"Error: start_date and end_date must be dates in YYYY-MM-DD format, got {start_date!r} and {end_date!r}"  
+        if start > end:  
+            print(f"Error: start_date {start} is after end_date {end}")  
+            return f"Error: start_date {start} is after end_date {end}"  
+        start_date, end_date = start.isoformat(), end.isoformat()  
+  
+        print(f"Fetching GitHub and Linear events for user: {username} from {start_date} to {end_date}")  
+        linear_issues, github_events = load_activity(username, start_date, end_date)  
+        events = format_activity(linear_issues, github_events)  
         print(f"Fetched events: {events}")  
         return events  
   
+    async def _arun(self, start_date: Optional[str] = None, end_date: Optional[str] = None) -> str:  
+        """Use the tool asynchronously."""  
+        print("Running Github_Linear_UpdateTool (async)")  
+        return await run_with_timeout(asyncio.to_thread(self._run, start_date, end_date), self.timeout, self.name)  
+  
 class GetUpdateFromMemoryTool(BaseTool):
     name = "get_update_from_memory"
     description = "Fetches the last SQL update for the given username from the environment variable"
+    timeout: float = 10
 
-    def _run(self) -> str:
-        """Use the tool."""
-        print("Running GetUpdateFromMemoryTool")
+    def _get_username(self):
+        """Reads and validates the username from the environment."""
         username = os.getenv("GITHUB_USERNAME")
         
         if not username:
             print("Error: GITHUB_USERNAME environment variable is not set")
             raise ValueError("GITHUB_USERNAME environment variable is not set")
+        return username
+
+    def _run(self) -> str:
+        """Use the tool."""
+        print("Running GetUpdateFromMemoryTool")
+        username = self._get_username()
         
         print(f"Fetching last SQL update for user: {username}")
         result = fetch_last_sql_update(username)
         print(f"Fetched result: {result}")
         return result  
-  
-  
\ No newline at end of file
+
+    async def _arun(self) -> str:
+        """Use the tool asynchronously."""
+        print("Running GetUpdateFromMemoryTool (async)")
+        username = self._get_username()
+
+        print(f"Fetching last SQL update for user: {username}")
+        result = await run_with_timeout(afetch_last_sql_update(username), self.timeout, self.name)
+        print(f"Fetched result: {result}")
+        return result
+
+####################################################################################################################################
+# USER CONTEXT ASSEMBLY
+####################################################################################################################################
+
+CONTEXT_TIMEOUT = 30
+# The bundle is cached per user per day, and refreshed after this many seconds so
+# background store syncs show up; submissions through sqlsearch invalidate it at once
+CONTEXT_TTL_SECONDS = int(os.getenv("USER_CONTEXT_TTL_SECONDS", "300"))
+
+# Assembled context per (username, day) as (context, cached_at); only fully successful bundles are cached
+_USER_CONTEXT_CACHE = {}
+# In-flight assemblies, so concurrent turns for the same user share one prefetch
+_USER_CONTEXT_PENDING = {}
+
+def invalidate_user_context(username):
+    """Drops the cached and in-flight context bundles of a user, e.g. after a new dailypulse row is written."""
+    for key in [k for k in _USER_CONTEXT_CACHE if k[0] == username]:
+        del _USER_CONTEXT_CACHE[key]
+    for key in [k for k in _USER_CONTEXT_PENDING if k[0] == username]:
+        del _USER_CONTEXT_PENDING[key]
+
+def compact_activity(linear_activities, github_events) -> str:
+    """Shrinks the stored Linear/GitHub activity to the fields the draft needs."""
+    if linear_activities is None:
+        linear_text = NOT_SYNCED
+    else:
+        linear_text = json.dumps(_compact_issues(linear_activities), separators=(',', ':'))
+    if github_events is None:
+        github_text = NOT_SYNCED
+    else:
+        github_lines = [line.strip() for line in format_github_events(github_events).splitlines() if line.strip()]
+        github_text = "\n".join(github_lines)
+    return f"Linear issues: {linear_text}\nGitHub events:\n{github_text}"
+
+def _compact_issues(linear_activities):
+    return [
+        {
+            "title": issue.get("title"),
+            "state": (issue.get("state") or {}).get("name"),
+            "createdAt": issue.get("createdAt"),
+            "updatedAt": issue.get("updatedAt"),
+            "comments": [comment["body"] for comment in issue.get("comments", {}).get("nodes", [])],
+        }
+        for issue in linear_activities
+    ]
+
+async def _assemble_user_context(username):
+    """Fetches the latest dailypulse row and the activity concurrently. Returns (context, complete)."""
+    start_date, end_date = get_report_range()
+    activity, last_update = await asyncio.gather(
+        run_with_timeout(
+            asyncio.to_thread(load_activity, username, start_date, end_date),
+            CONTEXT_TIMEOUT, "github_linear_update",
+        ),
+        run_with_timeout(afetch_last_sql_update(username), CONTEXT_TIMEOUT, "get_update_from_memory"),
+        return_exceptions=True,
+    )
+
+    complete = True
+    if isinstance(activity, (Exception, str)):
+        print(f"Error prefetching activity for {username}: {activity}")
+        activity_text = "Unavailable, use the github_linear_update tool."
+        complete = False
+    else:
+        linear_issues, github_events = activity
+        activity_text = compact_activity(linear_issues, github_events)
+        # A source that has not synced yet is noted in the text; refetch once it has
+        if linear_issues is None or github_events is None:
+            complete = False
+
+    if isinstance(last_update, Exception) or last_update.startswith("Error"):
+        print(f"Error prefetching last update for {username}: {last_update}")
+        last_update = "Unavailable, use the get_update_from_memory tool."
+        complete = False
+
+    context = (
+        f"### Latest dailypulse update for {username}\n{last_update}\n\n"
+        f"### GitHub and Linear activity from {start_date} to {end_date}\n{activity_text}"
+    )
+    return context, complete
+
+async def _prefetch_user_context(key, username):
+    """Assembles the bundle and caches it, unless the entry was invalidated while it ran."""
+    context, complete = await _assemble_user_context(username)
+    if complete and _USER_CONTEXT_PENDING.get(key) is asyncio.current_task():
+        # Drop the user's bundles from previous days
+        for cached_key in [k for k in _USER_CONTEXT_CACHE if k[0] == username]:
+            del _USER_CONTEXT_CACHE[cached_key]
+        _USER_CONTEXT_CACHE[key] = (context, time.monotonic())
+    return context
+
+def _forget_pending(key, task):
+    if _USER_CONTEXT_PENDING.get(key) is task:
+        del _USER_CONTEXT_PENDING[key]
+
+async def build_user_context() -> str:
+    """Returns the precomputed context block for the current user, cached per user per day."""
+    username, _, _, _ = get_github_linear_settings()
+    today = datetime.date.today().isoformat()
+    key = (username, today)
+
+    cached = _USER_CONTEXT_CACHE.get(key)
+    if cached and time.monotonic() - cached[1] < CONTEXT_TTL_SECONDS:
+        return cached[0]
+
+    task = _USER_CONTEXT_PENDING.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_prefetch_user_context(key, username))
+        _USER_CONTEXT_PENDING[key] = task
+        # Removed when the task finishes, not when a waiter is cancelled
+        task.add_done_callback(lambda done: _forget_pending(key, done))
+
+    # Shield the shared task so one cancelled turn does not cancel it for the others
+    return await asyncio.shield(task)
@@ -1,7 +1,10 @@
 import os
+import asyncio
+import threading
+from collections import OrderedDict
 from fastapi import FastAPI, Request, HTTPException
-from slack_bolt.adapter.fastapi import SlackRequestHandler
-from slack_bolt import App
+from slack_bolt.adapter.fastapi.async_handler import AsyncSlackRequestHandler
+from slack_bolt.async_app import AsyncApp
 from dotenv import load_dotenv
 import random
 from langchain_openai import AzureChatOpenAI
@@ -14,10 +17,16 @@ from langchain_core.runnables import ConfigurableFieldSpec
 #custom libraries that we will use later in the app
 from common.utils import (
     SQLSearchAgent, 
-    Github_Linear_UpdateTool
+    Github_Linear_UpdateTool,
+    GetUpdateFromMemoryTool,
+    build_user_context,
+    get_github_linear_settings
 )
-from common.callbacks import StdOutCallbackHandler
-from common.prompts import CUSTOM_CHATBOT_PROMPT 
+from common.activity_store import activity_sync_loop
+from common.fetch_info import get_db_pool
+from common.admission import AdmissionController, AdmissionRejected, estimate_tokens, estimate_messages_tokens, get_encoding
+from common.callbacks import StdOutCallbackHandler, ToolTimingCallbackHandler, AdmissionCallbackHandler
+from common.prompts import CUSTOM_CHATBOT_PROMPT, CUSTOM_CHATBOT_PREFIX
 
 # Load environment variables from credentials.env file
 load_dotenv("credentials.env")
@@ -31,8 +40,22 @@ cb_manager = CallbackManager(handlers=[cb_handler])
 
 COMPLETION_TOKENS = 2000
 
-# Initialize the Slack app
-slack_app = App(token=SLACK_BOT_TOKEN)
+# How often the background job refreshes the local activity store
+ACTIVITY_SYNC_INTERVAL_SECONDS = int(os.getenv("ACTIVITY_SYNC_INTERVAL_SECONDS", "900"))
+
+# Admission control for LLM-backed turns, sized against the Azure OpenAI TPM quota
+admission = AdmissionController(
+    max_concurrent_turns=int(os.getenv("MAX_CONCURRENT_TURNS", "8")),
+    tokens_per_minute=int(os.getenv("LLM_TOKENS_PER_MINUTE", "80000")),
+    user_tokens_per_minute=int(os.getenv("LLM_USER_TOKENS_PER_MINUTE", "20000")),
+    deadline_seconds=float(os.getenv("ADMISSION_DEADLINE_SECONDS", "20")),
+)
+BUSY_MESSAGE = "I'm handling a lot of requests right now. Please try again in a minute."
+TOO_LARGE_MESSAGE = "This conversation is too long for me to process. Please start a new conversation or send a shorter message."
+
+# Initialize the Slack app. AsyncApp runs listeners on the event loop so that
+# concurrent conversations share it instead of each tying up a worker thread.
+slack_app = AsyncApp(token=SLACK_BOT_TOKEN)
 
 
 llm = AzureChatOpenAI(deployment_name=os.environ["GPT4o_DEPLOYMENT_NAME"], temperature=0, max_tokens=COMPLETION_TOKENS, streaming=True, callback_manager=cb_manager, api_version="2024-05-01-preview")
@@ -44,18 +67,39 @@ sql_search = SQLSearchAgent(llm=llm, k=10, callback_manager=cb_manager,
 
 github_linear_update_tool = Github_Linear_UpdateTool(
     name="github_linear_update",
-    description="Fetches GitHub and Linear updates for the given username from the environment variable for yesterday's date",
+    description="Fetches GitHub and Linear updates for the given username from the environment variable for the previous working day, or for a given date range",
     verbose=False
 )
 
-tools = [sql_search, github_linear_update_tool]
+get_update_from_memory_tool = GetUpdateFromMemoryTool(
+    name="get_update_from_memory",
+    description="Fetches the most recent standup update for the given username from the dailypulse table",
+    verbose=False
+)
+
+tools = [sql_search, github_linear_update_tool, get_update_from_memory_tool]
 agent = create_openai_tools_agent(llm, tools, CUSTOM_CHATBOT_PROMPT)
 agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=False)
 # Initialize the FastAPI app
 app = FastAPI()
-handler = SlackRequestHandler(slack_app)
+handler = AsyncSlackRequestHandler(slack_app)
+
+# Prepared Cosmos history clients per (session_id, user_id), least recently used first.
+# RunnableWithMessageHistory calls the factory synchronously even under ainvoke, so the
+# blocking prepare_cosmos() runs once per conversation. The messages are reloaded at the
+# start of every turn (load_session_history), because the client writes its whole
+# in-memory list back and a stale copy would overwrite turns stored by another worker.
+SESSION_HISTORY_CACHE_SIZE = int(os.getenv("SESSION_HISTORY_CACHE_SIZE", "256"))
+_session_histories = OrderedDict()
+_session_histories_lock = threading.Lock()
 
 def get_session_history(session_id: str, user_id: str) -> CosmosDBChatMessageHistory:
+    key = (session_id, user_id)
+    with _session_histories_lock:
+        if key in _session_histories:
+            _session_histories.move_to_end(key)
+            return _session_histories[key]
+
     cosmos = CosmosDBChatMessageHistory(
         cosmos_endpoint=os.environ['AZURE_COSMOSDB_ENDPOINT'],
         cosmos_database=os.environ['AZURE_COSMOSDB_NAME'],
@@ -67,6 +111,16 @@ def get_session_history(session_id: str, user_id: str) -> CosmosDBChatMessageHis
 
     # prepare the cosmosdb instance
     cosmos.prepare_cosmos()
+    with _session_histories_lock:
+        _session_histories[key] = cosmos
+        while len(_session_histories) > SESSION_HISTORY_CACHE_SIZE:
+            _session_histories.popitem(last=False)
+    return cosmos
+
+def load_session_history(session_id: str, user_id: str) -> CosmosDBChatMessageHistory:
+    """Returns the conversation's history client with its messages freshly loaded from Cosmos. Blocking."""
+    cosmos = get_session_history(session_id, user_id)
+    cosmos.load_messages()
     return cosmos
 
 brain_agent_executor = RunnableWithMessageHistory(
@@ -100,39 +154,83 @@ ramdom_user_id = "user"+ str(random.randint(1, 1000))
 config={"configurable": {"session_id": random_session_id, "user_id": ramdom_user_id}}
 print(random_session_id, ramdom_user_id)
 
-def chat_with_agent(question):  
-    response = brain_agent_executor.invoke({"question": question}, config=config)["output"]
+@app.on_event("startup")
+async def on_startup():
+    """
+    Warm up the connections turns depend on, off the event loop, and start the
+    background job that keeps the local GitHub/Linear activity store in sync.
+    """
+    await asyncio.to_thread(get_session_history, random_session_id, ramdom_user_id)
+    # Load the tokenizer used for admission estimates; a failed load is cached and falls back to a character estimate
+    await asyncio.to_thread(get_encoding)
+    try:
+        await get_db_pool()
+    except Exception as e:
+        # The pool is retried on the first get_update_from_memory call
+        print(f"Error creating database pool: {e}")
+    app.state.activity_sync_task = asyncio.create_task(
+        activity_sync_loop(get_github_linear_settings, ACTIVITY_SYNC_INTERVAL_SECONDS)
+    )
+
+async def achat_with_agent(question, user_id=ramdom_user_id):
+    # The async executor dispatches the tool calls of one step concurrently;
+    # a fresh timing handler per turn reports how much time that saved.
+    # Prefetch the user's activity and last update so the first draft needs no tool loop
+    user_context = await build_user_context()
+    # Reload the history off the loop; the first LLM call sends the prompt, the user context and the history
+    history = await asyncio.to_thread(load_session_history, config["configurable"]["session_id"], config["configurable"]["user_id"])
+    estimated_tokens = (
+        estimate_tokens(CUSTOM_CHATBOT_PREFIX, user_context, question)
+        + estimate_messages_tokens(history.messages)
+        + COMPLETION_TOKENS
+    )
+    # Every LLM call of the turn, not only the first, is charged against the token budgets
+    turn_config = {
+        **config,
+        "callbacks": [
+            ToolTimingCallbackHandler(),
+            AdmissionCallbackHandler(admission, user_id, estimated_tokens, COMPLETION_TOKENS),
+        ],
+    }
+    # Raises AdmissionRejected if the turn cannot start before its deadline
+    async with admission.admit(user_id, estimated_tokens):
+        response = (await brain_agent_executor.ainvoke({"question": question, "user_context": user_context}, config=turn_config))["output"]
     return response
 
 
 @slack_app.event("app_mention")
-def handle_mentions(event, say):
+async def handle_mentions(event, say):
     """
     Event listener for mentions in Slack.
     Logs the event data when the bot is mentioned.
     """
     print("Mention event received:", event)
-    say("Hello! I received your mention.")
+    await say("Hello! I received your mention.")
 
 @slack_app.event("message")
-def handle_messages(event, say):
+async def handle_messages(event, say):
     """
     Event listener for messages in Slack.
     This function processes the text and sends a response based on the message type.
 
     Args:
         event (dict): The event data received from Slack.
-        say (callable): A function for sending a response to the channel.
+        say (callable): An async function for sending a response to the channel.
     """
     text = event["text"]
     channel_type = event.get("channel_type")
 
     if channel_type == "im":
-        response = chat_with_agent(text)
+        try:
+            response = await achat_with_agent(text, event.get("user", ramdom_user_id))
+        except AdmissionRejected as e:
+            # A turn over the token budget can never be admitted, retrying will not help
+            await say(TOO_LARGE_MESSAGE if e.reason == "too_large" else BUSY_MESSAGE)
+            return
         if response:
-            say(response)
+            await say(response)
         else:
-            say("Sorry, I didn't understand that. Can you please rephrase?")
+            await say("Sorry, I didn't understand that. Can you please rephrase?")
 
 @app.post("/slack/events")
 async def slack_events(request: Request):
@@ -145,5 +243,12 @@ async def slack_events(request: Request):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/metrics/admission")
+async def admission_metrics():
+    """
+    Route exposing admission-control metrics: admitted turns, rejections by reason and queue wait.
+    """
+    return admission.snapshot()
+
 # Run the app
 # uvicorn main:app --reload --port 3000 
\ No newline at end of file
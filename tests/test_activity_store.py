@@ -0,0 +1,139 @@
+import pytest
+
+from common import activity_store
+from common.activity_store import GITHUB, LINEAR, ActivityStore
+
+USERNAME = "octocat"
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ActivityStore(str(tmp_path / "activity.db"))
+
+
+@pytest.fixture
+def linear_api(monkeypatch):
+    """Monkeypatches the Linear fetchers. Set `pages` to the issues to return, an exception to raise mid-stream."""
+    state = {"pages": [], "since": []}
+
+    def iter_linear_user_activities_since(user_id, api_key, api_url, since):
+        state["since"].append(since)
+        for page in state["pages"]:
+            if isinstance(page, Exception):
+                raise page
+            yield from page
+
+    monkeypatch.setattr(activity_store, "fetch_linear_user_id", lambda *args: "user-1")
+    monkeypatch.setattr(activity_store, "iter_linear_user_activities_since", iter_linear_user_activities_since)
+    return state
+
+
+def issue(issue_id, updated_at, created_at, comments=()):
+    return {
+        "id": issue_id,
+        "title": issue_id,
+        "updatedAt": updated_at,
+        "createdAt": created_at,
+        "comments": {"nodes": [{"id": comment_id, "body": "", "createdAt": at} for comment_id, at in comments]},
+    }
+
+
+def event(event_id, created_at):
+    return {"id": event_id, "type": "WatchEvent", "created_at": created_at, "repo": {"name": "octo/repo"}}
+
+
+def sync_linear(store):
+    return store.sync_linear(USERNAME, "octocat@example.com", "key", "https://linear.invalid")
+
+
+def test_linear_issue_found_by_its_comments_and_creation(store, linear_api):
+    linear_api["pages"] = [[
+        # Commented on the 13th, then updated again later
+        issue("commented", "2025-01-20T09:00:00.000Z", "2024-11-01T09:00:00.000Z", [("c1", "2025-01-13T10:00:00.000Z")]),
+        issue("created", "2025-01-20T09:00:00.000Z", "2025-01-13T08:00:00.000Z"),
+        issue("updated", "2025-01-13T23:59:00.000Z", "2024-10-01T09:00:00.000Z"),
+        issue("untouched", "2025-01-20T09:00:00.000Z", "2024-10-01T09:00:00.000Z", [("c2", "2025-01-14T00:00:00.000Z")]),
+    ]]
+    sync_linear(store)
+
+    linear_issues, _ = store.activity_between(USERNAME, "2025-01-13", "2025-01-13")
+
+    assert sorted(issue["id"] for issue in linear_issues) == ["commented", "created", "updated"]
+
+
+def test_github_events_between_dates_inclusive(store):
+    store.upsert(GITHUB, USERNAME, [
+        event("1", "2025-01-09T23:59:59Z"),
+        event("2", "2025-01-10T00:00:00Z"),
+        event("3", "2025-01-12T23:59:59Z"),
+        event("4", "2025-01-13T00:00:00Z"),
+    ], "id", "created_at")
+
+    _, github_events = store.activity_between(USERNAME, "2025-01-10", "2025-01-12")
+
+    assert [event["id"] for event in github_events] == ["2", "3"]
+
+
+def test_failed_linear_page_keeps_cursor(store, linear_api, monkeypatch):
+    monkeypatch.setattr(activity_store, "SYNC_BATCH_SIZE", 1)
+    store.set_cursor(LINEAR, USERNAME, "2025-01-01T00:00:00.000Z")
+    linear_api["pages"] = [
+        [issue("first", "2025-01-13T09:00:00.000Z", "2025-01-13T09:00:00.000Z")],
+        ValueError("Error fetching user activities: 502"),
+    ]
+
+    with pytest.raises(ValueError):
+        sync_linear(store)
+    # The first issue was stored, but the cursor did not move past the failed page
+    assert store.activity_between(USERNAME, "2025-01-13", "2025-01-13")[0][0]["id"] == "first"
+    assert store.get_cursor(LINEAR, USERNAME) == "2025-01-01T00:00:00.000Z"
+
+    # The retry starts from the same point and then advances the cursor
+    linear_api["pages"] = [[
+        issue("first", "2025-01-13T09:00:00.000Z", "2025-01-13T09:00:00.000Z"),
+        issue("second", "2025-01-14T09:00:00.000Z", "2025-01-14T09:00:00.000Z"),
+    ]]
+    assert sync_linear(store) == 2
+    assert linear_api["since"][:2] == ["2025-01-01T00:00:00.000Z"] * 2
+    assert store.get_cursor(LINEAR, USERNAME) == "2025-01-14T09:00:00.000Z"
+
+    sync_linear(store)
+    assert linear_api["since"][2] == "2025-01-14T09:00:00.000Z"
+
+
+def test_github_sync_stops_at_cursor(store, monkeypatch):
+    store.set_cursor(GITHUB, USERNAME, "2025-01-13T10:00:00Z")
+    consumed = []
+
+    def iter_github_events(username):
+        for item in [
+            event("new", "2025-01-14T10:00:00Z"),
+            event("same-second", "2025-01-13T10:00:00Z"),
+            event("old", "2025-01-12T10:00:00Z"),
+            event("older", "2025-01-11T10:00:00Z"),
+        ]:
+            consumed.append(item["id"])
+            yield item
+
+    monkeypatch.setattr(activity_store, "iter_github_events", iter_github_events)
+
+    assert store.sync_github(USERNAME) == 2
+    # Events sharing the cursor's timestamp are kept, and no page past the cursor is read
+    assert consumed == ["new", "same-second", "old"]
+    assert store.get_cursor(GITHUB, USERNAME) == "2025-01-14T10:00:00Z"
+
+
+def test_has_synced_per_source(store, linear_api, monkeypatch):
+    monkeypatch.setattr(activity_store, "iter_github_events", lambda username: iter([event("1", "2025-01-13T10:00:00Z")]))
+    linear_api["pages"] = [ValueError("Linear is down")]
+
+    store.sync_user(USERNAME, "octocat@example.com", "key", "https://linear.invalid")
+
+    assert store.has_synced(USERNAME, GITHUB)
+    assert not store.has_synced(USERNAME, LINEAR)
+    assert not store.has_synced("someone-else", GITHUB)
+
+
+def test_batches():
+    assert list(activity_store.batches(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(activity_store.batches([], 2)) == []
@@ -0,0 +1,237 @@
+import asyncio
+import uuid
+
+import pytest
+
+from common import admission
+from common.admission import AdmissionController, AdmissionRejected, TokenBucket, estimate_tokens
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def admit_once(controller, user_id, tokens):
+    async with controller.admit(user_id, tokens):
+        pass
+
+
+def test_token_bucket_refills_over_time():
+    bucket = TokenBucket(60)  # one token per second
+    assert bucket.try_consume(60)
+    assert not bucket.try_consume(1)
+
+    # Pretend two seconds have passed
+    bucket.updated -= 2
+    assert bucket.try_consume(2)
+    assert not bucket.try_consume(1)
+
+
+def test_token_bucket_refill_is_capped_at_capacity():
+    bucket = TokenBucket(60)
+    bucket.updated -= 600
+    assert bucket.try_consume(60)
+    assert not bucket.try_consume(1)
+
+
+def test_token_bucket_charge_goes_into_debt():
+    bucket = TokenBucket(60)
+    bucket.charge(90)
+    assert bucket.tokens == pytest.approx(-30, abs=0.1)
+    assert bucket.seconds_until(1) == pytest.approx(31, abs=0.1)
+
+    bucket.charge(-500)
+    assert bucket.tokens == pytest.approx(60)
+
+
+def test_admit_rejects_turn_larger_than_any_bucket():
+    controller = AdmissionController(2, tokens_per_minute=1000, user_tokens_per_minute=100, deadline_seconds=1)
+    with pytest.raises(AdmissionRejected) as excinfo:
+        run(admit_once(controller, "alice", 101))
+    assert excinfo.value.reason == "too_large"
+    assert controller.global_bucket.tokens == pytest.approx(1000)
+
+
+def test_admit_waits_for_refill_within_deadline():
+    controller = AdmissionController(2, tokens_per_minute=600, user_tokens_per_minute=60, deadline_seconds=2)
+    controller._user_bucket("alice").tokens = 0.8
+
+    run(admit_once(controller, "alice", 1))
+
+    snapshot = controller.snapshot()
+    assert snapshot["admitted"] == 1
+    assert snapshot["queue_wait_seconds_max"] >= 0.15
+
+
+def test_admit_rejects_user_past_deadline_without_touching_global_budget():
+    controller = AdmissionController(2, tokens_per_minute=600, user_tokens_per_minute=60, deadline_seconds=0.05)
+    assert controller._user_bucket("alice").try_consume(60)
+
+    with pytest.raises(AdmissionRejected) as excinfo:
+        run(admit_once(controller, "alice", 30))
+    assert excinfo.value.reason == "user_rate_limited"
+    assert controller.global_bucket.tokens == pytest.approx(600)
+
+    # Other users keep their own share
+    run(admit_once(controller, "bob", 30))
+
+
+def test_tpm_rejection_refunds_user_bucket():
+    controller = AdmissionController(2, tokens_per_minute=100, user_tokens_per_minute=100, deadline_seconds=0.05)
+    assert controller.global_bucket.try_consume(100)
+
+    with pytest.raises(AdmissionRejected) as excinfo:
+        run(admit_once(controller, "alice", 50))
+    assert excinfo.value.reason == "tpm_budget"
+    assert controller._user_bucket("alice").tokens == pytest.approx(100)
+
+
+def test_concurrency_rejection_refunds_both_buckets():
+    controller = AdmissionController(1, tokens_per_minute=600, user_tokens_per_minute=600, deadline_seconds=0.05)
+
+    async def scenario():
+        async with controller.admit("alice", 100):
+            assert controller.snapshot()["in_flight"] == 1
+            with pytest.raises(AdmissionRejected) as excinfo:
+                await admit_once(controller, "bob", 100)
+            assert excinfo.value.reason == "concurrency"
+
+    run(scenario())
+
+    assert controller._user_bucket("bob").tokens == pytest.approx(600)
+    assert controller.global_bucket.tokens == pytest.approx(500, abs=1)
+
+
+def test_snapshot_reports_admissions_rejections_and_charges():
+    controller = AdmissionController(2, tokens_per_minute=600, user_tokens_per_minute=100, deadline_seconds=0.05)
+    run(admit_once(controller, "alice", 10))
+    run(admit_once(controller, "alice", 20))
+    with pytest.raises(AdmissionRejected):
+        run(admit_once(controller, "alice", 500))
+    controller.charge("alice", 40)
+
+    snapshot = controller.snapshot()
+    assert snapshot["admitted"] == 2
+    assert snapshot["in_flight"] == 0
+    assert snapshot["rejected"] == {"too_large": 1}
+    assert snapshot["charged_tokens"] == 40
+    assert snapshot["queue_wait_seconds_avg"] == pytest.approx(snapshot["queue_wait_seconds_total"] / 2)
+    assert controller._user_bucket("alice").tokens == pytest.approx(30, abs=0.1)
+
+    # The snapshot is a copy
+    snapshot["rejected"]["too_large"] = 99
+    assert controller.metrics["rejected"]["too_large"] == 1
+
+
+def test_estimate_tokens_falls_back_to_characters(monkeypatch):
+    monkeypatch.setattr(admission, "get_encoding", lambda: None)
+    assert estimate_tokens("a" * 40, None, "b" * 8) == 12
+
+
+def test_cancelled_while_waiting_for_global_budget_refunds_user_bucket():
+    controller = AdmissionController(2, tokens_per_minute=60, user_tokens_per_minute=600, deadline_seconds=60)
+    assert controller.global_bucket.try_consume(60)
+
+    async def scenario():
+        task = asyncio.ensure_future(admit_once(controller, "alice", 30))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    run(scenario())
+
+    assert controller._user_bucket("alice").tokens == pytest.approx(600)
+    assert controller.snapshot()["admitted"] == 0
+
+
+def test_cancelled_while_waiting_for_slot_refunds_both_buckets():
+    controller = AdmissionController(1, tokens_per_minute=600, user_tokens_per_minute=600, deadline_seconds=60)
+
+    async def scenario():
+        async with controller.admit("alice", 100):
+            task = asyncio.ensure_future(admit_once(controller, "bob", 100))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+    run(scenario())
+
+    assert controller._user_bucket("bob").tokens == pytest.approx(600)
+    assert controller.global_bucket.tokens == pytest.approx(500, abs=1)
+    # The held slot was released, not leaked to the cancelled turn
+    run(admit_once(controller, "bob", 100))
+
+
+@pytest.fixture
+def charged_turn(monkeypatch):
+    """A controller with a 120-token first call already admitted for alice, and the turn's handler."""
+    from common.callbacks import AdmissionCallbackHandler
+
+    monkeypatch.setattr(admission, "get_encoding", lambda: None)
+    controller = AdmissionController(2, tokens_per_minute=600, user_tokens_per_minute=600, deadline_seconds=1)
+    controller.charge("alice", 120)
+    handler = AdmissionCallbackHandler(controller, "alice", reserved_tokens=120, completion_tokens=100)
+    return controller, handler
+
+
+def chat_result(message, llm_output=None):
+    from langchain_core.outputs import ChatGeneration, LLMResult
+
+    return LLMResult(generations=[[ChatGeneration(message=message)]], llm_output=llm_output)
+
+
+def chat_result_with_usage(total_tokens):
+    from langchain_core.messages import AIMessage
+
+    return chat_result(AIMessage(content=""), {"token_usage": {"total_tokens": total_tokens}})
+
+
+def test_callback_handler_settles_calls_against_reported_usage(charged_turn):
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    controller, handler = charged_turn
+    messages = [[HumanMessage(content="a" * 40)]]  # 10 tokens plus 4 of message overhead
+    first, second = uuid.uuid4(), uuid.uuid4()
+
+    handler.on_chat_model_start({}, messages, run_id=first)
+    handler.on_llm_end(chat_result(AIMessage(content="draft"), {"token_usage": {"total_tokens": 50}}), run_id=first)
+    handler.on_chat_model_start({}, messages, run_id=second)
+    usage = {"input_tokens": 20, "output_tokens": 10, "total_tokens": 30}
+    handler.on_llm_end(chat_result(AIMessage(content="draft", usage_metadata=usage)), run_id=second)
+
+    # Only the tokens actually used stay charged
+    assert controller._user_bucket("alice").tokens == pytest.approx(600 - 50 - 30, abs=0.5)
+    assert controller.global_bucket.tokens == pytest.approx(600 - 50 - 30, abs=0.5)
+    assert handler.charged == {}
+
+
+def test_callback_handler_estimates_usage_when_not_reported(charged_turn):
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    controller, handler = charged_turn
+    run_id = uuid.uuid4()
+
+    handler.on_chat_model_start({}, [[HumanMessage(content="a" * 40)]], run_id=run_id)
+    # While the call runs, the full completion budget is held
+    assert controller._user_bucket("alice").tokens == pytest.approx(600 - 114, abs=0.5)
+    handler.on_llm_end(chat_result(AIMessage(content="b" * 40)), run_id=run_id)
+
+    # 14 prompt tokens plus 10 generated
+    assert controller._user_bucket("alice").tokens == pytest.approx(600 - 24, abs=0.5)
+
+
+def test_callback_handler_refunds_completion_budget_on_error(charged_turn):
+    from langchain_core.messages import HumanMessage
+
+    controller, handler = charged_turn
+    first, second = uuid.uuid4(), uuid.uuid4()
+
+    handler.on_chat_model_start({}, [[HumanMessage(content="a" * 40)]], run_id=first)
+    handler.on_llm_end(chat_result_with_usage(20), run_id=first)
+    handler.on_chat_model_start({}, [[HumanMessage(content="a" * 40)]], run_id=second)
+    handler.on_llm_error(RuntimeError("rate limited"), run_id=second)
+
+    assert controller._user_bucket("alice").tokens == pytest.approx(600 - 20 - 14, abs=0.5)
+    assert controller.snapshot()["refunded_tokens"] > 0
@@ -0,0 +1,105 @@
+import io
+import json
+
+import pytest
+
+from common import fetch_info
+from common.fetch_info import iter_connection_nodes, iter_linear_user_activities_since, iter_records
+
+ISSUE = {
+    "id": "issue-1",
+    "title": "Fix login",
+    "comments": {"nodes": [{"id": "comment-1", "body": "Done", "createdAt": "2025-01-13T10:00:00.000Z"}]},
+}
+PAGE_INFO = {"hasNextPage": True, "endCursor": "cursor-1"}
+
+
+def stream(body):
+    return io.BytesIO(json.dumps(body).encode())
+
+
+class RawBody(io.BytesIO):
+    """Response body that accepts the decode_content flag the fetchers set."""
+
+
+class FakeResponse:
+    def __init__(self, body, status_code=200):
+        self.status_code = status_code
+        self.text = json.dumps(body)
+        self.raw = RawBody(self.text.encode())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+def test_connection_nodes_and_page_info_from_one_stream():
+    page_info = {}
+    body = {"data": {"issues": {"pageInfo": PAGE_INFO, "nodes": [ISSUE, {**ISSUE, "id": "issue-2"}]}}}
+
+    nodes = list(iter_connection_nodes(stream(body), "data.issues", page_info))
+
+    assert [node["id"] for node in nodes] == ["issue-1", "issue-2"]
+    # Nested connections inside a node stay part of the node
+    assert nodes[0]["comments"]["nodes"] == ISSUE["comments"]["nodes"]
+    assert page_info == PAGE_INFO
+
+
+def test_page_info_after_nodes_is_still_read():
+    page_info = {}
+    body = {"data": {"issues": {"nodes": [ISSUE], "pageInfo": PAGE_INFO}}}
+
+    nodes = list(iter_connection_nodes(stream(body), "data.issues", page_info))
+
+    assert nodes == [ISSUE]
+    assert page_info == PAGE_INFO
+
+
+def test_graphql_errors_yield_nothing():
+    page_info = {}
+    body = {"errors": [{"message": "Argument Validation Error"}], "data": None}
+
+    assert list(iter_connection_nodes(stream(body), "data.issues", page_info)) == []
+    assert page_info == {}
+
+
+def test_linear_activities_follow_page_cursor(monkeypatch):
+    pages = [
+        {"data": {"issues": {"pageInfo": PAGE_INFO, "nodes": [ISSUE]}}},
+        {"data": {"issues": {"pageInfo": {"hasNextPage": False, "endCursor": None}, "nodes": [{**ISSUE, "id": "issue-2"}]}}},
+    ]
+    cursors = []
+
+    def post(url, headers, json, stream):
+        cursors.append(json["variables"]["after"])
+        return FakeResponse(pages[len(cursors) - 1])
+
+    monkeypatch.setattr(fetch_info.requests, "post", post)
+
+    issues = list(iter_linear_user_activities_since("user-1", "key", "https://linear.invalid", "2025-01-01T00:00:00.000Z"))
+
+    assert [issue["id"] for issue in issues] == ["issue-1", "issue-2"]
+    assert cursors == [None, "cursor-1"]
+
+
+def test_linear_activities_raise_on_graphql_errors(monkeypatch):
+    body = {"errors": [{"message": "Argument Validation Error"}], "data": None}
+    monkeypatch.setattr(fetch_info.requests, "post", lambda *args, **kwargs: FakeResponse(body))
+
+    with pytest.raises(ValueError, match="no pageInfo"):
+        list(iter_linear_user_activities_since("user-1", "key", "https://linear.invalid", "2025-01-01T00:00:00.000Z"))
+
+
+def test_linear_activities_raise_on_http_error(monkeypatch):
+    monkeypatch.setattr(fetch_info.requests, "post", lambda *args, **kwargs: FakeResponse({}, status_code=500))
+
+    with pytest.raises(ValueError, match="500"):
+        list(iter_linear_user_activities_since("user-1", "key", "https://linear.invalid", "2025-01-01T00:00:00.000Z"))
+
+
+def test_records_streamed_from_array():
+    events = [{"id": "1"}, {"id": "2"}]
+
+    assert list(iter_records(stream(events), fetch_info.GITHUB_EVENTS_PATH)) == events
@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+
+from common import utils
+from common.utils import Github_Linear_UpdateTool
+
+
+@pytest.fixture
+def tool_and_ranges(monkeypatch):
+    monkeypatch.setenv("GITHUB_USERNAME", "octocat")
+    monkeypatch.setenv("LINEAR_USER_EMAIL", "octocat@example.com")
+    monkeypatch.setenv("LINEAR_API_KEY", "key")
+    ranges = []
+
+    def load_activity(username, start_date, end_date):
+        ranges.append((start_date, end_date))
+        return [], []
+
+    monkeypatch.setattr(utils, "load_activity", load_activity)
+    return Github_Linear_UpdateTool(), ranges
+
+
+def test_valid_range_is_read_from_store(tool_and_ranges):
+    tool, ranges = tool_and_ranges
+    result = asyncio.run(tool.arun({"start_date": "2025-01-10", "end_date": "2025-01-12"}))
+
+    assert result.startswith("Linear Activities:")
+    assert ranges == [("2025-01-10", "2025-01-12")]
+
+
+@pytest.mark.parametrize("start_date, end_date", [
+    ("2025-01-10", "last friday"),
+    ("yesterday", None),
+    ("2025-01-12", "2025-01-10"),
+])
+def test_invalid_range_is_reported_not_raised(tool_and_ranges, start_date, end_date):
+    tool, ranges = tool_and_ranges
+    result = asyncio.run(tool.arun({"start_date": start_date, "end_date": end_date}))
+
+    assert result.startswith("Error:")
+    assert ranges == []
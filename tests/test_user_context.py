@@ -0,0 +1,155 @@
+import asyncio
+import datetime
+
+import pytest
+
+from common import utils
+
+USERNAME = "octocat"
+
+
+@pytest.fixture
+def fetches(monkeypatch):
+    """Monkeypatches the context sources. The n-th dailypulse fetch returns update n, after its gate opens if one is set."""
+    monkeypatch.setenv("GITHUB_USERNAME", USERNAME)
+    monkeypatch.setenv("LINEAR_USER_EMAIL", "octocat@example.com")
+    monkeypatch.setenv("LINEAR_API_KEY", "key")
+    monkeypatch.setattr(utils, "_USER_CONTEXT_CACHE", {})
+    monkeypatch.setattr(utils, "_USER_CONTEXT_PENDING", {})
+
+    state = {"activity": ([], []), "last_update": '{"update": "%d"}', "calls": 0, "gates": {}}
+
+    def load_activity(username, start_date, end_date):
+        return state["activity"]
+
+    async def afetch_last_sql_update(username):
+        call = state["calls"]
+        state["calls"] += 1
+        gate = state["gates"].get(call)
+        if gate is not None:
+            await gate.wait()
+        return state["last_update"].replace("%d", str(call))
+
+    monkeypatch.setattr(utils, "load_activity", load_activity)
+    monkeypatch.setattr(utils, "afetch_last_sql_update", afetch_last_sql_update)
+    return state
+
+
+def cache_key():
+    return (USERNAME, datetime.date.today().isoformat())
+
+
+def test_concurrent_turns_share_one_prefetch(fetches):
+    async def scenario():
+        return await asyncio.gather(*[utils.build_user_context() for _ in range(3)])
+
+    contexts = asyncio.run(scenario())
+
+    assert fetches["calls"] == 1
+    assert len(set(contexts)) == 1
+    assert '"update": "0"' in contexts[0]
+    # The done-callback removed the finished task, the bundle is cached
+    assert utils._USER_CONTEXT_PENDING == {}
+    assert utils._USER_CONTEXT_CACHE[cache_key()][0] == contexts[0]
+
+
+def test_cached_bundle_is_reused_until_ttl_expires(fetches):
+    first = asyncio.run(utils.build_user_context())
+    assert asyncio.run(utils.build_user_context()) == first
+    assert fetches["calls"] == 1
+
+    context, cached_at = utils._USER_CONTEXT_CACHE[cache_key()]
+    utils._USER_CONTEXT_CACHE[cache_key()] = (context, cached_at - utils.CONTEXT_TTL_SECONDS - 1)
+
+    refreshed = asyncio.run(utils.build_user_context())
+    assert fetches["calls"] == 2
+    assert '"update": "1"' in refreshed
+
+
+@pytest.mark.parametrize("activity, last_update", [
+    ((None, []), '{"update": "%d"}'),
+    (([], []), "Error fetching last SQL update: connection refused"),
+])
+def test_incomplete_bundle_is_not_cached(fetches, activity, last_update):
+    fetches["activity"] = activity
+    fetches["last_update"] = last_update
+
+    asyncio.run(utils.build_user_context())
+    asyncio.run(utils.build_user_context())
+
+    assert fetches["calls"] == 2
+    assert utils._USER_CONTEXT_CACHE == {}
+    assert utils._USER_CONTEXT_PENDING == {}
+
+
+def test_invalidation_during_prefetch_is_not_cached(fetches):
+    async def scenario():
+        stale_gate = asyncio.Event()
+        fetches["gates"][0] = stale_gate
+        stale = asyncio.ensure_future(utils.build_user_context())
+        await asyncio.sleep(0.01)
+        stale_task = utils._USER_CONTEXT_PENDING[cache_key()]
+
+        # A submission lands while the first prefetch is still running
+        utils.invalidate_user_context(USERNAME)
+        fresh = await utils.build_user_context()
+        assert fetches["calls"] == 2
+        assert utils._USER_CONTEXT_CACHE[cache_key()][0] == fresh
+
+        stale_gate.set()
+        stale_context = await stale
+        assert stale_task.done()
+        return stale_context, fresh
+
+    stale_context, fresh = asyncio.run(scenario())
+
+    assert '"update": "0"' in stale_context
+    assert '"update": "1"' in fresh
+    # The stale result did not overwrite the fresh bundle
+    assert utils._USER_CONTEXT_CACHE[cache_key()][0] == fresh
+    assert utils._USER_CONTEXT_PENDING == {}
+
+
+def test_finished_stale_prefetch_keeps_the_newer_pending_entry(fetches):
+    async def scenario():
+        fetches["gates"][0] = asyncio.Event()
+        fetches["gates"][1] = asyncio.Event()
+        stale = asyncio.ensure_future(utils.build_user_context())
+        await asyncio.sleep(0.01)
+        utils.invalidate_user_context(USERNAME)
+        fresh = asyncio.ensure_future(utils.build_user_context())
+        await asyncio.sleep(0.01)
+        fresh_task = utils._USER_CONTEXT_PENDING[cache_key()]
+
+        fetches["gates"][0].set()
+        await stale
+        # The stale task's done-callback must not drop the newer prefetch
+        assert utils._USER_CONTEXT_PENDING[cache_key()] is fresh_task
+        assert utils._USER_CONTEXT_CACHE == {}
+
+        fetches["gates"][1].set()
+        await fresh
+
+    asyncio.run(scenario())
+
+    assert utils._USER_CONTEXT_PENDING == {}
+    assert cache_key() in utils._USER_CONTEXT_CACHE
+
+
+def test_cancelled_turn_does_not_cancel_shared_prefetch(fetches):
+    async def scenario():
+        fetches["gates"][0] = asyncio.Event()
+        cancelled = asyncio.ensure_future(utils.build_user_context())
+        waiting = asyncio.ensure_future(utils.build_user_context())
+        await asyncio.sleep(0.01)
+
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        fetches["gates"][0].set()
+        return await waiting
+
+    context = asyncio.run(scenario())
+
+    assert fetches["calls"] == 1
+    assert utils._USER_CONTEXT_CACHE[cache_key()][0] == context